@@ -1,6 +1,14 @@
 from shiny import App, render, ui, reactive
 import pandas as pd
 
+
+def _li(html):
+    """
+    A list item from a snippet of raw HTML
+    """
+    return ui.HTML(f"<li>{html}</li>")
+
+
 code_str_for_CI_OTE = '''
 from scipy.stats import beta
 import numpy as np
@@ -59,8 +67,8 @@ example_results_df_html = """\
         <td>1.964</td>
         <td>0.95</td>
         <td>(1.11, 3.05)</td>
-        <td>0.02 *</td>
-        <td>0.04 *</td>
+        <td>0.024 *</td>
+        <td>0.047 *</td>
     </tr>
     <tr>
         <td>5</td>
@@ -69,8 +77,8 @@ example_results_df_html = """\
         <td>2.5</td>
         <td>0.95</td>
         <td>(0.28, 7.86)</td>
-        <td>0.29</td>
-        <td>0.29</td>
+        <td>0.296</td>
+        <td>0.296</td>
     </tr>
     </table>
 """
@@ -249,7 +257,7 @@ what_is_it_for = ui.tags.section(
     ),
     ui.tags.p(
         "Notice that while the OTE is higher in Subgroup 2 (2.5 > 1.964), the width of the confidence interval is much wider. "
-        "Correspondingly, the p-value of the null hypothesis of model calibration is larger for the Subgroup 2 (0.29 > 0.02). "
+        "Correspondingly, the p-value of the null hypothesis of model calibration is larger for the Subgroup 2 (0.296 > 0.024). "
         "We we see stronger evidence of miscalibration for Subgroup 1, despite lower OTE. "
     ),
     id="what",
@@ -260,16 +268,12 @@ who_is_it_for = ui.tags.section(
     ui.tags.p(
         "There are probably two groups of users:",
         ui.tags.ul(
-            ui.HTML(
-                "<li>"
+            _li(
                 "People who do not code heavily: product managers, executives, analysts, etc."
-                "</li>"
             ),
-            ui.HTML(
-                "<li>"
+            _li(
                 "People who do code heavily, "
                 "but wish to have a convenient tool and reference to correct uncertainty calculation in OTEs. "
-                "</li>"
             ),
         ),
     ),
@@ -353,24 +357,20 @@ other_methods = ui.tags.section(
         "<p>Some often forgotten facts about bootstrap make it susceptible to misuse:"
     ),
     ui.tags.ul(
-        ui.HTML(
-            "<li>"
+        _li(
             "<i>Bootstrap is only consistent asymptotically.</i> "
             "For example, when we have zero observed events, the boostrap CI would yield an interval of <code>[0, 0]</code>, "
             "which is clearly wrong for any non-zero probability events. "
             "This is problematic when we have low number of observations or small probabilities, "
             "and is a major limiting factor for when we need uncertainty "
             "estimates the most -- when data is scarce."
-            "</li>"
         ),
-        ui.HTML(
-            "<li>"
+        _li(
             "<i>Bootstrap is often done wrong.</i> E.g. very few seem to remember to "
             '<a target="_blank" href=https://en.wikipedia.org/wiki/Bootstrapping_(statistics)#Deriving_confidence_intervals_from_the_bootstrap_distribution>flip the percentiles</a> '
             "when constructing boostrap CIs. "
             "Resampling with replacements is also surprisingly prone to implementation errors. "
             "A wise man once told me \"I have never seen bootstrap done right\"."
-            "</li>"
         ),
     ),
     ui.tags.h5("Bayesian credible intervals"),
@@ -380,27 +380,22 @@ other_methods = ui.tags.section(
         "But one must fend off some inescapable questions. "
     ),
     ui.tags.ul(
-        ui.HTML(
-            "<li>"
+        _li(
             "<i>One often needs to justify the choice of priors.</i> "
             "And this can be tricky, especially when data is scarce "
             "and results are heavily swayed by the choice of priors. "
             "(What is a good choice of prior when we have only 5 observations?) "
             "On the other hand, if the results are not sensitive to our choice of priors, "
             "we probably don't need to be Bayesian in the first place."
-            "</li>"
         ),
-        ui.HTML(
-            "<li>"
+        _li(
             "<i>Bayesian credible intervals do not make valid confidence intervals.</i> "
             "If we want to avoid justifying priors to a skeptical audience, "
             'one might argue that it is "not so different from a frequentist CI". '
             "unforutnately, credible intervals constructed from most priors "
             "that we come up with do not have correct frequentist confidence coverages, especially for small probabilities. "
-            "</li>"
         ),
-        ui.HTML(
-            "<li>"
+        _li(
             "<i>Even when a credible intervals almost achieve nominal frequentist converage, "
             "they can have undesirable properties.</i> "
             "Some choice of priors <i>almost</i> make valid confidence intervals. "
@@ -419,7 +414,6 @@ other_methods = ui.tags.section(
             'Indeed, many procedures use the Baye\'s rule, but cannot be called "Bayesian methods", '
             "since they are not coherent in Bayesian evaluations."
             ")"
-            "</li>"
         ),
     ),
     id="other-methods",
@@ -487,3 +481,10 @@ about_page_content = ui.page_fluid(
         ),
     ),
 )
+
+# The About page is static: serialize the tag tree once at import time,
+# keeping its HTML dependencies so the page head is unchanged
+about_page_content = ui.TagList(
+    ui.HTML(str(about_page_content)),
+    *about_page_content.get_dependencies(),
+)
@@ -1,10 +1,18 @@
+from functools import lru_cache
+
 import pandas as pd
 import numpy as np
 
 from shiny import App, render, ui, reactive
 
 from constants import _CONF_LVL_COL, _CI_COL, _P_VAL_COL, _MULT_ADJ_P_VAL_COL
-from stats import ci_ote, calculate_p_value, p_val_to_str, BH_adjusted_pval
+from stats import (
+    ci_ote,
+    calculate_p_value,
+    p_val_to_str,
+    p_vals_to_str,
+    BH_adjusted_pval,
+)
 from about import about_page_content
 
 app_ui = ui.page_navbar(
@@ -95,26 +103,124 @@ app_ui = ui.page_navbar(
     id="page",
 )
 
-EMPTY_RESULTS_DF = pd.DataFrame(
-    {
-        "n": [],
-        "o": [],
-        "e": [],
-        "OTE": [],
-        _CONF_LVL_COL: [],
-        _CI_COL: [],
-        _P_VAL_COL: [],
+# Columns of the results store. Computed numeric columns are int64/float64 arrays;
+# o and e keep the values as entered, so that an integer input such as 11 is
+# displayed as 11 rather than 11.0. The CI and the displayed p-value are
+# pre-formatted strings. The raw p-values are kept for the multiple testing
+# adjustment, but not displayed.
+_RAW_P_VAL_COL = "raw p-val"
+RESULTS_COLUMN_DTYPES = {
+    "n": int,
+    "o": object,
+    "e": object,
+    "OTE": float,
+    _CONF_LVL_COL: float,
+    _CI_COL: object,
+    _P_VAL_COL: object,
+    _RAW_P_VAL_COL: float,
+}
+RESULTS_DISPLAY_COLUMNS = [
+    "n",
+    "o",
+    "e",
+    "OTE",
+    _CONF_LVL_COL,
+    _CI_COL,
+    _P_VAL_COL,
+]
+
+
+def empty_results_store(capacity=16):
+    """
+    Create an empty columnar store for the results table.
+
+    Rows are kept in order of calculation in preallocated arrays,
+    of which only the first `size` entries are valid.
+    """
+    return {
+        "size": 0,
+        "columns": {
+            col: np.empty(capacity, dtype=dtype)
+            for col, dtype in RESULTS_COLUMN_DTYPES.items()
+        },
     }
+
+
+def append_to_results_store(store, row):
+    """
+    Append one row (a dict keyed by column) to the results store.
+    Capacity is doubled when full, so appends are amortized O(1).
+
+    Returns a new store object sharing the column buffers, so that
+    setting it on a reactive value invalidates its dependents.
+    """
+    size, columns = store["size"], store["columns"]
+    if size == len(columns["n"]):
+        columns = {
+            col: np.concatenate([arr, np.empty_like(arr)])
+            for col, arr in columns.items()
+        }
+    for col, val in row.items():
+        columns[col][size] = val
+    return {"size": size + 1, "columns": columns}
+
+
+# (check, error message) pairs for the inputs, in the order they are reported
+INPUT_CHECKS = (
+    (
+        lambda n, o, e: isinstance(n, int) and (n > 0),
+        "Invalid number of samples (n). Number must be a positive integer.\n",
+    ),
+    (
+        lambda n, o, e: isinstance(o, (int, float)) and (0 <= o <= n),
+        "Invalid number of observed events (o). Number must be a non-negative number between 0 and n.\n",
+    ),
+    (
+        lambda n, o, e: isinstance(e, (int, float)) and (0 < e <= n),
+        "Invalid number of expected events (e). Number must be a positive number between 0 and n.\n",
+    ),
 )
 
-EMPTY_RESULTS_DISPLAY_DF = EMPTY_RESULTS_DF.copy()
-EMPTY_RESULTS_DISPLAY_DF[_MULT_ADJ_P_VAL_COL] = []
+
+def invalid_input_message(n, o, e):
+    """
+    Return the error message of the first failing input check, or None if all pass.
+    """
+    for is_valid, message in INPUT_CHECKS:
+        if not is_valid(n, o, e):
+            return message
+    return None
+
+
+@lru_cache(maxsize=None)
+def input_error_modal(message):
+    """
+    Build the error prompt for an input error message; one modal per message.
+    """
+    return ui.modal(
+        message,
+        title="Check input values",
+        easy_close=True,
+        footer=None,
+    )
+
+
+@lru_cache(maxsize=1024)
+def calculate_results_row(n, o, e, cl):
+    """
+    Calculate the OTE, its CI (formatted), and the p-value for one set of inputs.
+    Cached, so that re-entering inputs (e.g. after Undo or Clear) does not recompute.
+    """
+    ote = np.round(o / e, 3)
+    ci_lower, ci_upper = ci_ote(n, o, e, cl)
+    ci = f"({ci_lower:.2f}, {ci_upper:.2f})"
+    p_val = calculate_p_value(n, o, e)
+    return ote, ci, p_val
 
 
 def server(input, output, session):
 
-    results_df = reactive.value(EMPTY_RESULTS_DF.copy())
-    results_df_to_display = reactive.value(EMPTY_RESULTS_DISPLAY_DF.copy())
+    results_store = reactive.value(empty_results_store())
 
     @render.ui
     def observed_expected_inputs():
@@ -154,93 +260,64 @@ def server(input, output, session):
     def update_results_df():
         n, o, e = input.n_observations(), input.n_observed(), input.n_expected()
         cl = float(input.confidence_level())
-        results_df_val = results_df.get()
-
-        is_n_valid = isinstance(n, int) and (n > 0)
-        is_o_valid = isinstance(o, (int, float)) and (o <= n) and (o >= 0)
-        is_e_valid = isinstance(e, (int, float)) and (e <= n) and (e > 0)
-
-        if is_n_valid and is_o_valid and is_e_valid:
-            with ui.Progress(min=1, max=4) as progress_bar:
-                progress_bar.set(
-                    message="Calculation in progress", detail="This may take a while..."
-                )
-                ote = np.round(o / e, 3)
-                progress_bar.set(1, message="Calculating CI...")
-                ci = str(tuple(np.round(ci_ote(n, o, e, cl), 2)))
-                progress_bar.set(
-                    2,
-                    message="Calculating p value...",
-                    detail="This may take a while...",
-                )
-                p_val = calculate_p_value(n, o, e)
-                progress_bar.set(4, message="Updating table...")
-                results_df_val.loc[-1] = [
-                    n,
-                    o,
-                    e,
-                    ote,
-                    cl,
-                    ci,
-                    p_val,
-                ]
-                results_df_val.index = results_df_val.index + 1  # shifting index
-                results_df_val = results_df_val.sort_index()
+        results_store_val = results_store.get()
+
+        error_message = invalid_input_message(n, o, e)
+        if error_message is None:
+            ote, ci, p_val = calculate_results_row(n, o, e, cl)
+            new_row = {
+                "n": n,
+                "o": o,
+                "e": e,
+                "OTE": ote,
+                _CONF_LVL_COL: cl,
+                _CI_COL: ci,
+                _P_VAL_COL: p_val_to_str(p_val),
+                _RAW_P_VAL_COL: p_val,
+            }
+            results_store_val = append_to_results_store(results_store_val, new_row)
         else:
-            m = ""
-            if not is_n_valid:
-                m = "Invalid number of samples (n). Number must be a positive integer.\n"
-            elif not is_o_valid:
-                m = "Invalid number of observed events (o). Number must be a non-negative number between 0 and n.\n"
-            elif not is_e_valid:
-                m = "Invalid number of expected events (e). Number must be a positive number between 0 and n.\n"
-            error_prompt = ui.modal(
-                m,
-                title="Check input values",
-                easy_close=True,
-                footer=None,
-            )
-            ui.modal_show(error_prompt)
-        results_df.set(results_df_val)
+            ui.modal_show(input_error_modal(error_message))
+        results_store.set(results_store_val)
         return
 
     @reactive.effect
     @reactive.event(input.clear_button)
     def clear_results_df():
-        results_df.set(EMPTY_RESULTS_DF.copy())
+        # an already empty table is left alone, so the output is not re-rendered
+        if results_store.get()["size"] > 0:
+            results_store.set(empty_results_store())
         return
 
     @reactive.effect
     @reactive.event(input.undo_button)
     def remove_entry_from_results_df():
-        results_df_val = results_df.get()
-        if len(results_df_val) > 0:
-            results_df_val = results_df_val.iloc[1:]
-            results_df_val = results_df_val.reset_index(drop=True)
-            results_df.set(results_df_val)
+        results_store_val = results_store.get()
+        if results_store_val["size"] > 0:
+            # the last calculated row is dropped by shrinking the valid size
+            results_store.set(
+                {
+                    "size": results_store_val["size"] - 1,
+                    "columns": results_store_val["columns"],
+                }
+            )
         return
 
     @render.data_frame
     def show_results_df():
         """
-        Take raw values of the results dataframe, and apply formatting
+        Build the display table from the results store, newest results on top,
+        and add the formatted adjusted p-values
         """
-        results_df_val = results_df.get()
-        results_df_to_display_val = results_df_val.copy()
-        # calculate adjusted p-values
-        adj_p_vals = BH_adjusted_pval(results_df_to_display_val[_P_VAL_COL])
-        results_df_to_display_val[_MULT_ADJ_P_VAL_COL] = adj_p_vals
-        # format p-values
-        results_df_to_display_val[_P_VAL_COL] = (
-            results_df_to_display_val[_P_VAL_COL].astype(float).apply(p_val_to_str)
-        )
-        results_df_to_display_val[_MULT_ADJ_P_VAL_COL] = (
-            results_df_to_display_val[_MULT_ADJ_P_VAL_COL]
-            .astype(float)
-            .apply(p_val_to_str)
+        results_store_val = results_store.get()
+        size, columns = results_store_val["size"], results_store_val["columns"]
+        results_df_to_display_val = pd.DataFrame(
+            {col: columns[col][:size][::-1] for col in RESULTS_DISPLAY_COLUMNS}
         )
-        results_df_to_display.set(results_df_to_display_val)
-        return render.DataTable(results_df_to_display())
+        # calculate adjusted p-values, which depend on the whole table
+        adj_p_vals = BH_adjusted_pval(columns[_RAW_P_VAL_COL][:size][::-1])
+        results_df_to_display_val[_MULT_ADJ_P_VAL_COL] = p_vals_to_str(adj_p_vals)
+        return render.DataTable(results_df_to_display_val)
 
 
 app = App(app_ui, server)
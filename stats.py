@@ -1,11 +1,10 @@
-from collections.abc import Iterable
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
-from scipy.stats import beta
-from scipy.optimize import fmin
+from scipy.special import betainc, betaincc, betaincinv, betainccinv
 
-from constants import _P_VAL_COL, _MULT_ADJ_P_VAL_COL
+from constants import _MULT_ADJ_P_VAL_COL
 
 # from numpy import random
 # from matplotlib import pyplot as plt
@@ -17,36 +16,70 @@ def ci_ote(n, o, e, cl=0.95):
 
     Parameters
     ----------
-    n : int
+    n : int or array-like
         number of observations
-    o : float, non-negative
+    o : float or array-like, non-negative
         number of observed defaults
-    e : float, positive
+    e : float or array-like, positive
         number of expected defaults
     cl : float, optional
         the confidence level, by default 0.95
 
     Returns
     -------
-    numpy.array
-        the left and right end points of the "CI for OTE"
-    """
-    # CI for "true default probability"
-    dist = beta(a=(1 / 2 + o), b=(1 / 2 + n - o))
-    ci_default_prob = np.array([dist.ppf((1 - cl) / 2), dist.ppf((1 + cl) / 2)])
-    # correction at edges
-    # ... which statsmodels.stats.proportion.proportion_confint does not do
-    if o == 0:
-        ci_default_prob[0] = 0
-    if n == o:
+    tuple
+        the left and right end points of the "CI for OTE";
+        each end point is an array when n, o, e are arrays
+    """
+    return _ci_ote_at_cl(cl)(n, o, e)
+
+
+# bounded: cl comes from callers, while the UI only offers a few levels
+@lru_cache(maxsize=16)
+def _ci_ote_at_cl(cl):
+    """
+    Specialize `ci_ote` on the confidence level, which takes only a few values.
+    The tail probability of the CI is computed once per confidence level.
+    """
+    # betaincinv/betainccinv are the beta quantile functions without the
+    # rv_continuous layer; the upper end point inverts the upper tail at
+    # (1 - cl) / 2, which keeps its precision when cl is close to 1
+    tail_prob = (1 - cl) / 2
+
+    def default_prob_ci(n, o):
+        n, o = np.asarray(n, dtype=float), np.asarray(o, dtype=float)
+        a, b = 1 / 2 + o, 1 / 2 + n - o
+        # start from the corrections at edges, known without any quantile:
+        # the lower end point is 0 when o == 0, the upper one is 1 when n == o
+        # ... which statsmodels.stats.proportion.proportion_confint does not do
+        ci_default_prob = np.zeros((2,) + n.shape)
         ci_default_prob[1] = 1
-    # CI for "OTE"
-    ci = ci_default_prob * n / e
-    return tuple(ci)
+        need_lower, need_upper = o != 0, n != o
+        ci_default_prob[0, need_lower] = betaincinv(
+            a[need_lower], b[need_lower], tail_prob
+        )
+        ci_default_prob[1, need_upper] = betainccinv(
+            a[need_upper], b[need_upper], tail_prob
+        )
+        return ci_default_prob
+
+    def ci_ote_at_cl(n, o, e):
+        # CI for "true default probability"
+        n, o, e = np.broadcast_arrays(n, o, e)
+        ci_default_prob = default_prob_ci(n, o)
+        # CI for "OTE"
+        ci = ci_default_prob * n / e
+        return tuple(ci)
+
+    return ci_ote_at_cl
 
 
 def ci_ote_hdi(n, o, e, cl=0.95):
-    beta_hdi = calculate_beta_hdi(a=(1 / 2 + o), b=(1 / 2 + (n - o)), p=cl)
+    if np.ndim(n) == np.ndim(o) == np.ndim(e) == 0:
+        beta_hdi = calculate_beta_hdi(a=(1 / 2 + o), b=(1 / 2 + (n - o)), p=cl)
+    else:
+        n, o, e = np.broadcast_arrays(n, o, e)
+        beta_hdi = calculate_beta_hdi_batch(a=(1 / 2 + o), b=(1 / 2 + (n - o)), p=cl)
     ci = beta_hdi * n / e
     return ci
 
@@ -60,32 +93,147 @@ def calculate_beta_hdi(a, b, p=0.95):
     a: first parameter of beta distribution, aka \alpha
     b: second parameter of beta distribution, aka \beta
     p: desired probability mass
+
+    Results are cached; a, b and p are rounded to 9 decimals for the cache key.
     """
-    # freeze distribution with given arguments
-    dist = beta(a=a, b=b)
-    # initial guess for HDIlowTailPr
-    q = 1.0 - p
+    hdi = _calculate_beta_hdi(
+        round(float(a), 9), round(float(b), 9), round(float(p), 9)
+    )
+    # copy, so that callers cannot modify the cached array
+    return hdi.copy()
+
+
+@lru_cache(maxsize=4096)
+def _calculate_beta_hdi(a, b, p):
+    # scipy.optimize is slow to import, and is only needed here
+    from scipy.optimize import brentq
+
+    # symmetric densities need no search, as the HDI of a symmetric unimodal
+    # density is the equal-tailed interval;
+    # U-shaped or flat densities fall back to the equal-tailed interval
+    if a == b or (a <= 1 and b <= 1):
+        return betaincinv(a, b, [(1 - p) / 2, (1 + p) / 2])
+    # other densities without an interior mode have their HDI at an edge
+    if a <= 1:
+        # decreasing density: the HDI starts at 0
+        return betaincinv(a, b, [0, p])
+    if b <= 1:
+        # increasing density: the HDI ends at 1
+        return betaincinv(a, b, [1 - p, 1])
 
-    def interval_width(lower_tail_prob):
-        return dist.ppf(p + lower_tail_prob) - dist.ppf(lower_tail_prob)
+    def log_density_gap(lower_tail_prob):
+        low, high = betaincinv(a, b, [lower_tail_prob, p + lower_tail_prob])
+        # log pdf(low) - log pdf(high); the normalizing constants cancel,
+        # so no pdf evaluation is needed
+        with np.errstate(divide="ignore"):
+            return (a - 1) * (np.log(low) - np.log(high)) + (b - 1) * (
+                np.log1p(-low) - np.log1p(-high)
+            )
 
-    # find lower_tail_prob that minimizes interval_width
-    HDI_CI_left = fmin(interval_width, q, ftol=1e-4, disp=False)[0]
+    # the HDI end points have equal density; the log density gap is -inf
+    # at lower_tail_prob = 0 and positive at lower_tail_prob = 1 - p
+    HDI_CI_left = brentq(log_density_gap, 0, 1 - p, xtol=1e-10)
     # return interval as array([low, high])
-    return dist.ppf([HDI_CI_left, p + HDI_CI_left])
+    return betaincinv(a, b, [HDI_CI_left, p + HDI_CI_left])
 
 
-def calculate_p_value(n, o, e):
-    conf_levels = (
-        list(np.arange(0.01, 0.99, 0.01))
-        + list(np.arange(0.99, 0.999, 0.001))
-        + list(np.arange(0.999, 1, 0.0001))
+def calculate_beta_hdi_batch(a, b, p=0.95, grid_size=32, n_passes=3):
+    """
+    Find the highest-density intervals of many beta distributions at once.
+
+    The interval width is evaluated on a grid of lower tail probabilities for all
+    distributions at once; the grid is then narrowed around the best point, and
+    the final minimum is refined by a parabola through the best point and its
+    neighbours.
+
+    Parameters:
+    ----------
+    a: array of first parameters of the beta distributions, aka \alpha
+    b: array of second parameters of the beta distributions, aka \beta
+    p: desired probability mass
+    grid_size: number of lower tail probabilities in each grid
+    n_passes: number of successively narrower grids
+
+    Returns numpy.array of shape (2, ...), the lower and upper ends of the intervals.
+    """
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+    grid = np.linspace(0, 1, grid_size).reshape((grid_size,) + (1,) * a.ndim)
+    bracket_low, bracket_high = np.zeros(a.shape), np.full(a.shape, 1 - p)
+    for _ in range(n_passes):
+        grid_step = (bracket_high - bracket_low) / (grid_size - 1)
+        lower_tail_probs = bracket_low + (bracket_high - bracket_low) * grid
+        # one quantile call over the whole (grid, distributions) array per end point
+        interval_width = betaincinv(a, b, lower_tail_probs + p) - betaincinv(
+            a, b, lower_tail_probs
+        )
+        best = interval_width.argmin(axis=0)[np.newaxis]
+        HDI_CI_left = np.take_along_axis(lower_tail_probs, best, axis=0)[0]
+        bracket_low = np.maximum(HDI_CI_left - grid_step, 0)
+        bracket_high = np.minimum(HDI_CI_left + grid_step, 1 - p)
+
+    # parabolic refinement, for minima away from the ends of the last grid
+    is_interior = (best > 0) & (best < grid_size - 1)
+    mid = np.clip(best, 1, grid_size - 2)
+    width_prev = np.take_along_axis(interval_width, mid - 1, axis=0)[0]
+    width_mid = np.take_along_axis(interval_width, mid, axis=0)[0]
+    width_next = np.take_along_axis(interval_width, mid + 1, axis=0)[0]
+    curvature = width_prev - 2 * width_mid + width_next
+    offset = np.divide(
+        grid_step * (width_prev - width_next),
+        2 * curvature,
+        out=np.zeros_like(curvature),
+        where=is_interior[0] & (curvature > 0),
     )
-    for cl in conf_levels:
-        ci = ci_ote(n, o, e, cl=cl)
-        if (ci[0] < 1) and (1 < ci[1]):
-            break
-    return 1 - cl
+    HDI_CI_left = np.clip(HDI_CI_left + offset, 0, 1 - p)
+    # symmetric densities have the equal-tailed interval as HDI;
+    # U-shaped or flat densities fall back to it
+    is_equal_tailed = (a == b) | ((a <= 1) & (b <= 1))
+    HDI_CI_left = np.where(is_equal_tailed, (1 - p) / 2, HDI_CI_left)
+    # return intervals as array([low, high])
+    return betaincinv(a, b, np.stack([HDI_CI_left, p + HDI_CI_left]))
+
+
+def calculate_p_value(n, o, e):
+    """
+    Calculate the p-value of the hypothesis OTE = 1, i.e. one minus the smallest
+    confidence level whose "CI for OTE" covers 1.
+
+    Results are cached; fractional o and e are rounded to 6 decimals for the cache key.
+    """
+    return _calculate_p_value(int(n), round(float(o), 6), round(float(e), 6))
+
+
+@lru_cache(maxsize=4096)
+def _calculate_p_value(n, o, e):
+    return float(calculate_p_values(n, o, e))
+
+
+def calculate_p_values(n, o, e):
+    """
+    Vectorized version of `calculate_p_value`, for arrays of n, o, e.
+
+    Returns numpy.array of p-values.
+    """
+    n, o, e = (np.asarray(x, dtype=float) for x in (n, o, e))
+    # The "CI for OTE" covers 1 exactly when e / n lies between the two quantiles
+    # of the Beta distribution used in `ci_ote`, i.e. when both tail probabilities
+    # of e / n exceed (1 - cl) / 2. The smallest such cl has a closed form.
+    a, b = 1 / 2 + o, 1 / 2 + n - o
+    # the edge corrections remove one of the two conditions
+    lower_tail_prob = np.where(o != 0, betainc(a, b, e / n), 1)
+    upper_tail_prob = np.where(n != o, betaincc(a, b, e / n), 1)
+    return np.minimum(2 * np.minimum(lower_tail_prob, upper_tail_prob), 1)
+
+
+def calculate_adjusted_p_values(n, o, e):
+    """
+    Calculate the p-values for 1-d arrays of n, o, e, together with their
+    Benjamini-Hochberg adjusted p-values, without a round trip through pandas.
+
+    Returns a tuple of numpy.arrays (p-values, adjusted p-values).
+    """
+    p_vals = calculate_p_values(n, o, e)
+    return p_vals, _BH_adjust(p_vals)
 
 
 def p_val_to_str(p_val):
@@ -103,16 +251,31 @@ def p_val_to_str(p_val):
     -------
     str
     """
-    sig_level = ""
-    if p_val < 0.001:
-        p_val_str = "0.001 (<) ***"
-    else:
-        if p_val < 0.01:
-            sig_level = " **"
-        elif p_val < 0.05:
-            sig_level = " *"
-        p_val_str = str(np.round(p_val, 3)) + sig_level
-    return p_val_str
+    return p_vals_to_str(p_val).item()
+
+
+# significance thresholds, and the indicator for p-values in each bracket
+_SIG_THRESHOLDS = np.array([0.001, 0.01, 0.05])
+_SIG_LEVELS = np.array([" ***", " **", " *", ""])
+
+
+def p_vals_to_str(p_vals):
+    """
+    Vectorized version of `p_val_to_str`, formatting an array of p-values at once.
+
+    Parameters
+    ----------
+    p_vals : array-like of float
+
+    Returns
+    -------
+    numpy.array of str
+    """
+    p_vals = np.asarray(p_vals, dtype=float)
+    # index of the bracket each p-value falls in, from "< 0.001" up to ">= 0.05"
+    sig_idx = np.searchsorted(_SIG_THRESHOLDS, p_vals, side="right")
+    p_vals_str = np.char.add(np.round(p_vals, 3).astype(str), _SIG_LEVELS[sig_idx])
+    return np.where(sig_idx == 0, "0.001 (<) ***", p_vals_str)
 
 
 def BH_adjusted_pval(p_vals):
@@ -122,19 +285,31 @@ def BH_adjusted_pval(p_vals):
 
     Returns a Pandas series of G-H adjusted p-values.
     """
-    if isinstance(p_vals, Iterable):
-        p_val_series = pd.Series(p_vals, name=_P_VAL_COL)
-    else:
+    try:
+        p_val_array = np.asarray(p_vals, dtype=np.float64)
+    except (TypeError, ValueError):
+        p_val_array = None
+    if p_val_array is None or p_val_array.ndim == 0:
         raise ValueError(
             f"BH adjustment only takes an iterable of p-vals; received {p_vals=}"
         )
 
-    p_val_df = p_val_series.astype(float).to_frame()
-    p_val_df["rank"] = p_val_df[_P_VAL_COL].astype(float).rank()
-    p_val_df.sort_values(by="rank", ascending=False, inplace=True)
-    p_val_df[_MULT_ADJ_P_VAL_COL] = (
-        p_val_df[_P_VAL_COL] * len(p_val_df) / p_val_df["rank"]
-    ).cummin()
-    p_val_df[_MULT_ADJ_P_VAL_COL] = np.minimum(p_val_df[_MULT_ADJ_P_VAL_COL], 1)
-    p_val_df.sort_index(inplace=True)
-    return p_val_df[_MULT_ADJ_P_VAL_COL]
+    adj_p_vals = _BH_adjust(p_val_array.ravel())
+    # keep the index of a pandas input
+    index = p_vals.index if isinstance(p_vals, pd.Series) else None
+    return pd.Series(adj_p_vals, index=index, name=_MULT_ADJ_P_VAL_COL)
+
+
+def _BH_adjust(p_vals):
+    """
+    Benjamini-Hochberg adjustment of a 1-d float array, returned in the original order.
+    """
+    m = len(p_vals)
+    order = np.argsort(p_vals)
+    adj_sorted = p_vals[order] * m / np.arange(1, m + 1)
+    # running minimum from the largest p-value down; NaN p-values sort last,
+    # and fmin keeps them from spreading to the other adjusted p-values
+    adj_sorted = np.fmin.accumulate(adj_sorted[::-1])[::-1]
+    adj_p_vals = np.empty_like(adj_sorted)
+    adj_p_vals[order] = np.minimum(adj_sorted, 1)
+    return adj_p_vals